@@ -1,14 +1,15 @@
 import streamlit as st
 import os
 import time
-import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Import Our Modules ---
 # Ensure your llm.py exports these functions!
-from llm import run_llm_agent, get_thread_history, get_all_thread_ids
+from llm import stream_llm_agent, get_thread_history, get_all_thread_ids
 from audio_transcribe import transcribe_audio
 from tts import generate_speech
+from common import extract_image_path
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -24,8 +25,13 @@ if "current_thread_id" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "last_processed_audio" not in st.session_state:
-    st.session_state.last_processed_audio = None
+if "thread_cache" not in st.session_state:
+    # Threads this session has already loaded, keyed by thread ID.
+    # Each entry is the same list object as 'messages' while that thread is open.
+    st.session_state.thread_cache = {st.session_state.current_thread_id: st.session_state.messages}
+
+if "last_processed_audio_id" not in st.session_state:
+    st.session_state.last_processed_audio_id = None
 
 if "audio_widget_key" not in st.session_state:
     st.session_state.audio_widget_key = 1
@@ -35,18 +41,75 @@ if "audio_widget_key" not in st.session_state:
 def switch_thread(thread_id):
     """Loads a specific conversation history."""
     st.session_state.current_thread_id = thread_id
-    st.session_state.messages = get_thread_history(thread_id)
-    st.session_state.last_processed_audio = None
+    # Only hit the database for threads we haven't loaded in this session yet
+    if thread_id in st.session_state.thread_cache:
+        st.session_state.messages = st.session_state.thread_cache[thread_id]
+    else:
+        st.session_state.messages = get_thread_history(thread_id)
+        # An empty result may be a failed read, so only keep real history
+        if st.session_state.messages:
+            st.session_state.thread_cache[thread_id] = st.session_state.messages
+    st.session_state.last_processed_audio_id = None
     # Increment widget key to reset audio input on thread switch
     st.session_state.audio_widget_key += 1
 
 def create_new_chat():
     """Starts a fresh conversation thread."""
     new_id = str(uuid.uuid4())
+    st.session_state.thread_cache[new_id] = []
     switch_thread(new_id)
 
+def stream_agent_response(query):
+    """
+    Streams the agent's answer into an assistant bubble and returns its text.
+    """
+    thread_id = st.session_state.current_thread_id
+    with st.spinner("Thinking..."), st.chat_message("assistant"):
+        placeholder = st.empty()
+        with placeholder.container():
+            streamed_text = st.write_stream(stream_llm_agent(query, thread_id))
+        
+        # The stream also carries any text the model wrote before calling a
+        # tool (e.g. "Let me search."). Once the turn is saved, keep only the
+        # final answer, so the chat, the audio and the stored history agree.
+        # (If the stream ended with an error instead, keep what was shown.)
+        response_text = streamed_text
+        history = get_thread_history(thread_id)
+        if history and history[-1]["role"] == "assistant":
+            final_text = history[-1]["content"]
+            if isinstance(streamed_text, str) and streamed_text.endswith(final_text):
+                response_text = final_text
+        placeholder.markdown(response_text)
+    
+    return response_text
+
+def build_assistant_message(response_text):
+    """
+    Builds the assistant message dictionary for a response.
+    Speech is synthesized in a worker thread while the image check runs.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tts_future = executor.submit(
+            generate_speech, response_text, f"response_{int(time.time())}.mp3"
+        )
+        
+        msg_data = {"role": "assistant", "content": response_text}
+        
+        # Check for Image (JPG or PNG)
+        image_path = extract_image_path(response_text)
+        if image_path and os.path.exists(image_path):
+            msg_data["image"] = image_path
+        
+        # Wait for the Audio
+        with st.spinner("Speaking..."):
+            msg_data["audio"] = tts_future.result()
+    
+    return msg_data
+
 # --- Sidebar Layout ---
-with st.sidebar:
+@st.fragment
+def render_sidebar():
+    """Renders the thread list as a fragment so it can rerun on its own."""
     st.header("🗂️ Conversations")
     
     # New Chat Button
@@ -69,6 +132,9 @@ with st.sidebar:
             switch_thread(t_id)
             st.rerun()
 
+with st.sidebar:
+    render_sidebar()
+
 # --- Main Page Layout ---
 st.title("🎙️ AI Voice Search Agent")
 st.caption(f"Session ID: {st.session_state.current_thread_id}")
@@ -82,11 +148,14 @@ audio_bytes = st.audio_input(
 
 # Logic to handle NEW audio input
 if audio_bytes:
-    current_audio_data = audio_bytes.getvalue()
+    # Streamlit gives every new recording a fresh file_id, so compare that
+    # instead of copying the audio out of the widget on each rerun
+    current_audio_id = getattr(audio_bytes, "file_id", id(audio_bytes))
     
     # Check if this is actually new audio
-    if st.session_state.last_processed_audio != current_audio_data:
-        st.session_state.last_processed_audio = current_audio_data
+    if st.session_state.last_processed_audio_id != current_audio_id:
+        st.session_state.last_processed_audio_id = current_audio_id
+        current_audio_data = audio_bytes.getvalue()
         
         with st.spinner("Transcribing..."):
             user_text = transcribe_audio(current_audio_data)
@@ -95,22 +164,11 @@ if audio_bytes:
             # 1. User Message
             st.session_state.messages.append({"role": "user", "content": user_text})
             
-            # 2. Agent Response (Pass Thread ID for Memory!)
-            with st.spinner("Thinking..."):
-                response_text = run_llm_agent(user_text, st.session_state.current_thread_id)
-            
-            # 3. Construct Assistant Message Dictionary
-            msg_data = {"role": "assistant", "content": response_text}
+            # 2. Agent Response (streamed, on the current thread)
+            response_text = stream_agent_response(user_text)
             
-            # Check for Image (JPG or PNG)
-            match = re.search(r"(generated_image_\d+\.(jpg|png))", response_text)
-            if match and os.path.exists(match.group(1)):
-                msg_data["image"] = match.group(1)
-            
-            # Generate Audio
-            with st.spinner("Speaking..."):
-                audio_file = generate_speech(response_text, f"response_{int(time.time())}.mp3")
-                msg_data["audio"] = audio_file
+            # 3. Construct Assistant Message Dictionary (Image + Audio)
+            msg_data = build_assistant_message(response_text)
             
             # 4. Append to State
             st.session_state.messages.append(msg_data)
@@ -129,46 +187,39 @@ if submitted and text_input:
     # 1. User Message
     st.session_state.messages.append({"role": "user", "content": text_input})
     
-    # 2. Agent Response (Pass Thread ID!)
-    with st.spinner("Thinking..."):
-        response_text = run_llm_agent(text_input, st.session_state.current_thread_id)
-    
-    # 3. Construct Assistant Message Dictionary
-    msg_data = {"role": "assistant", "content": response_text}
+    # 2. Agent Response (streamed, on the current thread)
+    response_text = stream_agent_response(text_input)
     
-    # Check for Image
-    match = re.search(r"(generated_image_[\w-]+\.(jpg|png))", response_text)
-    if match and os.path.exists(match.group(1)):
-        msg_data["image"] = match.group(1)
-
-    # Generate Audio
-    with st.spinner("Speaking..."):
-        audio_file = generate_speech(response_text, f"response_{int(time.time())}.mp3")
-        msg_data["audio"] = audio_file
+    # 3. Construct Assistant Message Dictionary (Image + Audio)
+    msg_data = build_assistant_message(response_text)
         
     # 4. Append to State
     st.session_state.messages.append(msg_data)
     
     # Clear audio state so user can switch back to voice easily
-    st.session_state.last_processed_audio = None
+    st.session_state.last_processed_audio_id = None
     st.rerun()
 
 # --- Display Conversation History ---
-st.divider()
-for msg in st.session_state.messages:
-    if msg["role"] == "user":
-        with st.chat_message("user"):
-            st.write(msg["content"])
-    else:
-        with st.chat_message("assistant"):
-            st.write(msg["content"])
+@st.fragment
+def render_history():
+    """Renders the conversation as a fragment, independent of the input widgets."""
+    for msg in st.session_state.messages:
+        if msg["role"] == "user":
+            with st.chat_message("user"):
+                st.write(msg["content"])
+        else:
+            with st.chat_message("assistant"):
+                st.write(msg["content"])
             
-            # Display Image if present
-            if "image" in msg and msg["image"]:
-                st.image(msg["image"], caption="Generated Image", width=400)
+                # Display Image if present
+                if "image" in msg and msg["image"]:
+                    st.image(msg["image"], caption="Generated Image", width=400)
             
-            # Display Audio if present
-            if "audio" in msg and os.path.exists(msg["audio"]):
-                with open(msg["audio"], "rb") as f:
-                    audio_data = f.read()
-                st.audio(audio_data, format="audio/mp3", start_time=0)
\ No newline at end of file
+                # Display Audio if present
+                # (pass the path so Streamlit serves it from its media cache)
+                if "audio" in msg and os.path.exists(msg["audio"]):
+                    st.audio(msg["audio"], format="audio/mp3", start_time=0)
+
+st.divider()
+render_history()
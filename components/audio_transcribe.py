@@ -1,18 +1,24 @@
 import os
 import io
+import streamlit as st
 from groq import Groq
 from dotenv import load_dotenv
 
 # --- Load API Keys ---
 load_dotenv()
 
-try:
-    # Initialize the Groq client
-    client = Groq()
-except Exception as e:
-    print(f"Error initializing Groq client: {e}")
-    print("Please make sure your .env file is set up with GROQ_API_KEY.")
-    exit()
+# Turbo variant of Whisper large-v3: much faster on Groq, near-identical accuracy
+TRANSCRIBE_MODEL = "whisper-large-v3-turbo"
+
+@st.cache_resource
+def get_client():
+    """Initializes the Groq client once per process."""
+    try:
+        return Groq()
+    except Exception as e:
+        print(f"Error initializing Groq client: {e}")
+        print("Please make sure your .env file is set up with GROQ_API_KEY.")
+        raise
 
 def transcribe_audio(audio_bytes: bytes) -> str:
     """
@@ -31,9 +37,9 @@ def transcribe_audio(audio_bytes: bytes) -> str:
         # and provide a filename for the API.
         audio_file = ("mic_audio.wav", audio_bytes)
 
-        transcription = client.audio.transcriptions.create(
+        transcription = get_client().audio.transcriptions.create(
             file=audio_file,
-            model="whisper-large-v3",
+            model=TRANSCRIBE_MODEL,
             response_format="text"
         )
 
@@ -0,0 +1,16 @@
+import re
+from typing import Optional
+
+# Matches the filenames written by the generate_image tool
+# (e.g. 'generated_image_1712345678.jpg')
+IMG_RE = re.compile(r"generated_image_[\w-]+\.(?:jpg|png)")
+
+def extract_image_path(text: str) -> Optional[str]:
+    """
+    Finds a generated image filename in a response.
+
+    Returns:
+        The filename, or None if the text doesn't mention one.
+    """
+    match = IMG_RE.search(text)
+    return match.group(0) if match else None
@@ -1,5 +1,7 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
 import time
 from dotenv import load_dotenv
@@ -20,6 +22,21 @@ if not CLOUDFLARE_API_TOKEN or not CLOUDFLARE_ACCOUNT_ID:
 IMAGE_MODEL_NAME = "@cf/lykon/dreamshaper-8-lcm"
 # IMAGE_MODEL_NAME = "@cf/runwayml/stable-diffusion-v1-5" # Alternative, slower model
 
+# Shared session so repeated image requests reuse the TLS connection to Cloudflare.
+# Rate limits and transient gateway errors are retried with a short backoff.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=["POST"],
+        raise_on_status=False # Hand the final response to raise_for_status below
+    )
+))
+
 @tool
 def generate_image(prompt: str) -> str:
     """
@@ -44,17 +61,17 @@ def generate_image(prompt: str) -> str:
         "num_steps": 20 # Lower for faster generation, higher for better quality
     }
 
+    response = None
     try:
-        response = requests.post(api_url, headers=headers, json=payload)
+        response = _session.post(api_url, headers=headers, json=payload, stream=True)
         response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
         
-        # Cloudflare Workers AI returns a JPEG byte stream directly
-        image_bytes = response.content
-        
-        # Save the image to a unique file
+        # Cloudflare Workers AI returns a JPEG byte stream directly.
+        # Stream it to a unique file instead of buffering the whole image in memory.
         output_filename = f"generated_image_{int(time.time())}.jpg"
         with open(output_filename, "wb") as f:
-            f.write(image_bytes)
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
         
         print(f"--- 🖼️ [Image Gen Tool] Image saved to: {output_filename} ---")
         return (
@@ -73,6 +90,10 @@ def generate_image(prompt: str) -> str:
             return f"Error: Failed to generate image. Network or API issue: {e}"
     except Exception as e:
         return f"An unexpected error occurred during image generation: {e}"
+    finally:
+        # Release the connection even if the body was never fully read
+        if response is not None:
+            response.close()
 
 # --- This part is for testing ---
 if __name__ == "__main__":
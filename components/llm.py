@@ -1,37 +1,49 @@
-import re
+import streamlit as st
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
 # --- New LangChain Imports ---
-from langchain_groq import ChatGroq
+# The heavy pieces (ChatGroq, LangGraph, the tools) are imported inside the
+# factories below, so rendering the sidebar doesn't pay for loading them.
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.sqlite import SqliteSaver
 import sqlite3
 
-try:
-    from search import search_the_web
-    from web_scraper import scrape_web_page
-    from image_gen import generate_image
-except ImportError:
-    print("Error: Could not import 'search_the_web'.")
-    print("Make sure 'components/search.py' is a LangChain tool (@tool).")
-    exit()
+from common import extract_image_path
+
+if TYPE_CHECKING:
+    from langgraph.graph import MessagesState
 
 # --- Load API Keys ---
 load_dotenv()
 
-# --- 1. Set up the Model (LLM) ---
-# We'll use Mixtral, which is stable for tool use.
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0.0
-)
+# --- 1. Define the Tools ---
+@st.cache_resource
+def get_tools():
+    """Imports the agent's tools on first use."""
+    try:
+        from search import search_the_web
+        from web_scraper import scrape_web_page
+        from image_gen import generate_image
+    except ImportError:
+        print("Error: Could not import 'search_the_web'.")
+        print("Make sure 'components/search.py' is a LangChain tool (@tool).")
+        exit()
 
-# --- 2. Define the Tools ---
-# We just put our imported search_the_web function in a list.
-tools = [search_the_web, scrape_web_page, generate_image]
-llm_with_tools = llm.bind_tools(tools)
+    # We just put our imported search_the_web function in a list.
+    return [search_the_web, scrape_web_page, generate_image]
+
+# --- 2. Set up the Model (LLM) ---
+@st.cache_resource
+def get_llm():
+    """Creates the tool-bound chat model once per process."""
+    from langchain_groq import ChatGroq
+
+    # We'll use Mixtral, which is stable for tool use.
+    llm = ChatGroq(
+        model="llama-3.3-70b-versatile",
+        temperature=0.0
+    )
+    return llm.bind_tools(get_tools())
 
 sys_msg = SystemMessage(
     content=(
@@ -54,7 +66,7 @@ sys_msg = SystemMessage(
     )
 )
 
-def agent_node(state: MessagesState):
+def agent_node(state: "MessagesState"):
     """
     The 'Brain' node. It takes the current state (messages), 
     appends the system prompt if needed, and calls the LLM.
@@ -66,36 +78,55 @@ def agent_node(state: MessagesState):
     if len(messages) == 0 or not isinstance(messages[0], SystemMessage):
         messages = [sys_msg] + messages
 
-    response = llm_with_tools.invoke(messages)
+    response = get_llm().invoke(messages)
     
     # Return the update to the state (LangGraph automagically appends this)
     return {"messages": [response]}
 
-tool_node = ToolNode(tools, handle_tool_errors=True)
+@st.cache_resource
+def get_memory_conn():
+    """Opens the SQLite connection shared by every session in this process."""
+    conn = sqlite3.connect("memory.db", check_same_thread=False)
+    # WAL lets readers (sidebar, history) proceed while a checkpoint is being
+    # written, and NORMAL sync is crash-safe under WAL with far fewer fsyncs.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    return conn
+
+@st.cache_resource
+def get_react_graph():
+    """Builds and compiles the agent graph once per process."""
+    from langgraph.graph import StateGraph, MessagesState, START
+    from langgraph.prebuilt import ToolNode, tools_condition
+    from langgraph.checkpoint.sqlite import SqliteSaver
 
-builder = StateGraph(MessagesState)
+    tool_node = ToolNode(get_tools(), handle_tool_errors=True)
 
-# Add Nodes
-builder.add_node("agent", agent_node)
-builder.add_node("tools", tool_node)
+    builder = StateGraph(MessagesState)
 
-# Add Edges
-# Start -> Agent
-builder.add_edge(START, "agent")
-builder.add_conditional_edges("agent", tools_condition)
+    # Add Nodes
+    builder.add_node("agent", agent_node)
+    builder.add_node("tools", tool_node)
 
-# Tools -> Agent
-# After a tool runs, we always go back to the agent to "read" the result.
-builder.add_edge("tools", "agent")
+    # Add Edges
+    # Start -> Agent
+    builder.add_edge(START, "agent")
+    builder.add_conditional_edges("agent", tools_condition)
 
-memory_conn = sqlite3.connect("memory.db", check_same_thread=False)
-memory = SqliteSaver(memory_conn)
-react_graph = builder.compile(checkpointer=memory)
+    # Tools -> Agent
+    # After a tool runs, we always go back to the agent to "read" the result.
+    builder.add_edge("tools", "agent")
 
+    memory = SqliteSaver(get_memory_conn())
+    return builder.compile(checkpointer=memory)
+
+@st.cache_data(ttl=30, show_spinner=False)
 def get_all_thread_ids():
     """Returns a list of all conversation IDs from the database."""
     try:
-        cursor = memory_conn.cursor()
+        cursor = get_memory_conn().cursor()
         # Query the checkpoints table for distinct thread_ids
         cursor.execute("SELECT DISTINCT thread_id FROM checkpoints")
         return [row[0] for row in cursor.fetchall()]
@@ -103,43 +134,47 @@ def get_all_thread_ids():
         print(f"Error fetching threads: {e}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _load_thread_history(thread_id):
+    """
+    Reads a thread's messages from its latest checkpoint.
+    Errors are raised (and therefore never cached); the TTL picks up turns
+    written by other processes sharing memory.db.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    # Read only the thread's latest checkpoint straight from the saver,
+    # instead of rebuilding the full graph state with get_state()
+    checkpoint_tuple = get_react_graph().checkpointer.get_tuple(config)
+    if not checkpoint_tuple:
+        return []
+    
+    messages = checkpoint_tuple.checkpoint["channel_values"].get("messages", [])
+    formatted_msgs = []
+    
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            formatted_msgs.append({"role": "user", "content": msg.content})
+        
+        elif isinstance(msg, AIMessage):
+            # Filter out empty tool calls (which have no content)
+            if msg.content and isinstance(msg.content, str) and msg.content.strip():
+                content = msg.content
+                
+                # Look for a generated .jpg or .png in the response text
+                img_path = extract_image_path(content)
+
+                formatted_msgs.append({
+                    "role": "assistant", 
+                    "content": content,
+                    "image": img_path
+                })
+                
+    return formatted_msgs
+
 def get_thread_history(thread_id):
     """Fetches the message history for a specific thread."""
-    config = {"configurable": {"thread_id": thread_id}}
     try:
-        snapshot = react_graph.get_state(config)
-        if not snapshot.values:
-            return []
-        
-        messages = snapshot.values.get("messages", [])
-        formatted_msgs = []
-        
-        for msg in messages:
-            if isinstance(msg, HumanMessage):
-                formatted_msgs.append({"role": "user", "content": msg.content})
-            
-            elif isinstance(msg, AIMessage):
-                # Filter out empty tool calls (which have no content)
-                if msg.content and isinstance(msg.content, str) and msg.content.strip():
-                    content = msg.content
-                    img_path = None
-                    
-                    # Robust Image Regex Check
-                    try:
-                        # Look for .jpg or .png in the response text
-                        match = re.search(r"(generated_image_\d+\.(jpg|png))", content)
-                        if match: 
-                            img_path = match.group(1)
-                    except Exception as re_error:
-                        print(f"Regex error parsing image: {re_error}")
-
-                    formatted_msgs.append({
-                        "role": "assistant", 
-                        "content": content,
-                        "image": img_path
-                    })
-                    
-        return formatted_msgs
+        return _load_thread_history(thread_id)
     except Exception as e:
         print(f"Error fetching history: {e}")
         return []
@@ -164,7 +199,12 @@ def run_llm_agent(user_query: str, thread_id: str = "session_1") -> str:
     try:
         # Stream or Invoke? Invoke is simpler for now.
         # The graph handles the loop (Agent -> Tool -> Agent -> Final Answer) internally.
-        final_state = react_graph.invoke({"messages": [input_message]}, config=config)
+        final_state = get_react_graph().invoke({"messages": [input_message]}, config=config)
+        
+        # The thread just changed on disk, so drop its cached history and
+        # refresh the sidebar list (this may be the thread's first message).
+        _load_thread_history.clear(thread_id)
+        get_all_thread_ids.clear()
         
         # Extract the last message (the AI's final response)
         last_message = final_state["messages"][-1]
@@ -177,6 +217,37 @@ def run_llm_agent(user_query: str, thread_id: str = "session_1") -> str:
         print(f"An error occurred in the LangGraph agent: {e}")
         return f"Error: {e}"
 
+def stream_llm_agent(user_query: str, thread_id: str = "session_1"):
+    """
+    Streams the LangGraph agent's answer token by token.
+    
+    Same arguments as run_llm_agent, but yields text chunks as the model
+    produces them (e.g. for st.write_stream) instead of waiting for the
+    whole Agent -> Tool -> Agent loop to finish.
+    """
+    print(f"\n--- 🚀 [LangGraph Agent] New Streamed Query: '{user_query}' ---")
+    
+    config = {"configurable": {"thread_id": thread_id}}
+    input_message = HumanMessage(content=user_query)
+    
+    try:
+        for chunk, metadata in get_react_graph().stream(
+            {"messages": [input_message]}, config=config, stream_mode="messages"
+        ):
+            # Only forward the model's own text, not tool output or tool-call chunks
+            if metadata.get("langgraph_node") == "agent" and isinstance(chunk.content, str):
+                if chunk.content:
+                    yield chunk.content
+
+    except Exception as e:
+        print(f"An error occurred in the LangGraph agent: {e}")
+        yield f"Error: {e}"
+
+    finally:
+        # Same invalidation as run_llm_agent once the turn is checkpointed
+        _load_thread_history.clear(thread_id)
+        get_all_thread_ids.clear()
+
 if __name__ == "__main__":
     print("Testing LangGraph Agent...")
     
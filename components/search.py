@@ -1,11 +1,85 @@
 import os
-from serpapi import GoogleSearch
+import orjson
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from langchain_core.tools import tool
 
 # Load API keys
 load_dotenv()
 
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+# Shared session so follow-up searches reuse the TLS connection to SerpAPI
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        raise_on_status=False
+    )
+))
+
+def _api_error(response: requests.Response) -> str:
+    """Returns the message from SerpAPI's {"error": ...} body, if it sent one."""
+    try:
+        return orjson.loads(response.content).get("error") or response.reason
+    except (orjson.JSONDecodeError, AttributeError):
+        return response.reason
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _run_search(query: str, serpapi_key: str) -> str:
+    """
+    Calls SerpAPI and condenses the results for the LLM.
+    Cached for 10 minutes per query, since the agent often repeats a search
+    across retries. Errors are raised (and therefore never cached).
+    """
+    params = {
+        "engine": "google",
+        "q": query,
+        "api_key": serpapi_key,
+        "num": 5 # Request top 5 results
+    }
+
+    # requests' own error messages include the full URL, api_key and all,
+    # so report failures from the status code and SerpAPI's error text instead
+    try:
+        response = _session.get(SERPAPI_URL, params=params, timeout=10)
+    except requests.RequestException as e:
+        raise RuntimeError(f"Could not reach SerpAPI ({type(e).__name__})") from None
+
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"SerpAPI returned status {response.status_code}: {_api_error(response)}"
+        )
+    results = orjson.loads(response.content)
+
+    # --- Process the results ---
+    # We will extract and simplify the results to send to the LLM.
+
+    output_parts = []
+
+    # 1. Check for a direct answer box (e.g., "What is 2+2?")
+    answer = results.get("answer_box", {}).get("result")
+    if answer:
+        output_parts.append(f"Direct Answer: {answer}")
+
+    # 2. Check for snippets from top organic results
+    for result in results.get("organic_results", [])[:3]: # Look at top 3
+        title = result.get("title", "No Title")
+        snippet = result.get("snippet", "No Snippet")
+        output_parts.append(f"Title: {title}\nSnippet: {snippet}\n---")
+
+    if not output_parts:
+        return "No relevant search results found."
+
+    return "\n".join(output_parts)
+
 @tool
 def search_the_web(query: str) -> str:
     """
@@ -20,39 +94,9 @@ def search_the_web(query: str) -> str:
         return "Error: SERPAPI_API_KEY not set."
 
     try:
-        params = {
-            "engine": "google",
-            "q": query,
-            "api_key": serpapi_key,
-            "num": 5 # Request top 5 results
-        }
-
-        search = GoogleSearch(params)
-        results = search.get_dict()
-
-        # --- Process the results ---
-        # We will extract and simplify the results to send to the LLM.
-
-        output_parts = []
-
-        # 1. Check for a direct answer box (e.g., "What is 2+2?")
-        if "answer_box" in results:
-            answer = results["answer_box"].get("result")
-            if answer:
-                output_parts.append(f"Direct Answer: {answer}")
-
-        # 2. Check for snippets from top organic results
-        if "organic_results" in results:
-            for result in results["organic_results"][:3]: # Look at top 3
-                title = result.get("title", "No Title")
-                snippet = result.get("snippet", "No Snippet")
-                output_parts.append(f"Title: {title}\nSnippet: {snippet}\n---")
-
-        if not output_parts:
-            return "No relevant search results found."
-
+        output = _run_search(query, serpapi_key)
         print("--- 🔎 Search complete. ---")
-        return "\n".join(output_parts)
+        return output
 
     except Exception as e:
         print(f"--- 🔎 Search error: {e} ---")
@@ -1,23 +1,165 @@
 import asyncio
+import concurrent.futures
 import edge_tts
+import hashlib
+import logging
+import math
 import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
 # A good, fast, natural-sounding voice
 VOICE = "en-US-GuyNeural" 
 
+# Synthesized clips are cached on disk, keyed by (voice, text), so repeated
+# answers never hit the network twice. Entries unused for a week are pruned.
+CACHE_DIR = "tts_cache"
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Pruning scans the whole cache directory, so run it at most this often
+PRUNE_INTERVAL_SECONDS = 60 * 60
+_next_prune = 0.0 # time.monotonic() after which the next cache miss prunes
+
+# One long-lived event loop on a daemon thread runs every synthesis, instead of
+# asyncio.run() building and tearing down a fresh loop on each call
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="tts-loop", daemon=True).start()
+
+# Upper bound on how long a caller waits for one utterance
+TTS_TIMEOUT_SECONDS = 30
+
+# Cap on simultaneous Edge TTS connections when synthesizing a batch
+MAX_CONCURRENT_TTS = 8
+
+# Edge sends audio in small (few KB) messages. Buffering the file in 64 KB
+# blocks turns a short utterance into a couple of write() calls, not one per chunk.
+WRITE_BUFFER_BYTES = 64 * 1024
+
+def _on_tts_loop() -> bool:
+    """
+    True when called from a coroutine running on _LOOP itself, where blocking
+    on a future would deadlock the loop that has to produce the result.
+    Any other caller (plain thread or a different running loop) is fine.
+    """
+    try:
+        return asyncio.get_running_loop() is _LOOP
+    except RuntimeError:
+        return False
+
+def _cache_path(text: str) -> str:
+    """Returns the cache file for this text in the current voice."""
+    key = hashlib.blake2b(f"{VOICE}|{text}".encode(), digest_size=16).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".mp3")
+
+def _link_or_copy(src: str, dst: str):
+    """Hardlinks src to dst (no data copied), copying instead across filesystems."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def _touch_cached(cache_path: str) -> bool:
+    """Marks a cached clip as recently used. Returns False if it isn't cached."""
+    try:
+        os.utime(cache_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _read_cached(cache_path: str) -> Optional[bytes]:
+    """Returns a cached clip's bytes (marking it as used), or None if it isn't cached."""
+    try:
+        os.utime(cache_path)
+        with open(cache_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _prune_cache():
+    """Deletes cache entries that haven't been used within CACHE_TTL_SECONDS."""
+    cutoff = time.time() - CACHE_TTL_SECONDS
+    try:
+        entries = list(os.scandir(CACHE_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass # Already removed by another session
+
+def _schedule_prune():
+    """
+    Starts a background prune if the last one was over PRUNE_INTERVAL_SECONDS
+    ago. Only called on _LOOP, so the timestamp needs no lock.
+    """
+    global _next_prune
+    now = time.monotonic()
+    if now < _next_prune:
+        return
+    _next_prune = now + PRUNE_INTERVAL_SECONDS
+    # Not awaited: nobody needs to wait for old clips to be deleted
+    asyncio.get_running_loop().run_in_executor(None, _prune_cache)
+
+async def _stream_audio(text: str):
+    """
+    Yields the MP3 audio chunks for the text as Edge TTS produces them
+    (boundary metadata messages are skipped).
+    """
+    communicate = edge_tts.Communicate(text, VOICE)
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            yield chunk["data"]
+
 async def _generate_speech_async(text: str, file_path: str):
     """
     Internal async function to generate and save speech.
     """
-    print(f"--- 🔊 Generating speech for: '{text[:30]}...' ---")
+    logger.debug("--- 🔊 Generating speech for: '%.30s...' ---", text)
     try:
-        communicate = edge_tts.Communicate(text, VOICE)
-        # Use the file_path variable passed to the function
-        await communicate.save(file_path)
-        print(f"--- 🔊 Audio saved to: {file_path} ---")
+        # Write each chunk to the file_path as soon as it arrives
+        with open(file_path, "wb", buffering=WRITE_BUFFER_BYTES) as f:
+            async for data in _stream_audio(text):
+                f.write(data)
+        logger.debug("--- 🔊 Audio saved to: %s ---", file_path)
         
     except Exception as e:
-        print(f"An error occurred during speech generation: {e}")
+        logger.error("An error occurred during speech generation: %s", e)
+        raise
+
+async def _generate_cached_async(text: str, file_path: str):
+    """
+    Writes speech for the text to file_path, synthesizing it only on a cache miss.
+    """
+    cache_path = _cache_path(text)
+
+    # Disk work runs in a worker thread, so it never stalls other
+    # syntheses sharing _LOOP (e.g. the rest of a generate_speech_many batch)
+    if await asyncio.to_thread(_touch_cached, cache_path):
+        logger.debug("--- 🔊 TTS cache hit for: '%.30s...' ---", text)
+    else:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Synthesize into a temp file first so a failed or concurrent
+        # generation never leaves a partial clip under the cache key
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=CACHE_DIR)
+        os.close(fd)
+        try:
+            await _generate_speech_async(text, tmp_path)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _schedule_prune()
+
+    await asyncio.to_thread(_link_or_copy, cache_path, file_path)
 
 def generate_speech(text_to_speak: str, output_file_path: str) -> str:
     """
@@ -27,17 +169,113 @@ def generate_speech(text_to_speak: str, output_file_path: str) -> str:
     Returns:
         The path to the saved audio file.
     """
+    if _on_tts_loop():
+        logger.error("Error: generate_speech called from the TTS event loop.")
+        return "Error: Could not run asyncio: called from the TTS event loop"
+
+    # Pass the unique output_file_path to the async function,
+    # running it on the shared background loop
+    future = asyncio.run_coroutine_threadsafe(
+        _generate_cached_async(text_to_speak, output_file_path), _LOOP
+    )
     try:
-        # Pass the unique output_file_path to the async function
-        asyncio.run(_generate_speech_async(text_to_speak, output_file_path))
+        future.result(timeout=TTS_TIMEOUT_SECONDS)
         return output_file_path
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        logger.error("Speech generation timed out after %ss", TTS_TIMEOUT_SECONDS)
+        return f"Error: Speech generation timed out after {TTS_TIMEOUT_SECONDS}s"
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+        return f"Error: {e}"
+
+async def _generate_many_async(pairs):
+    """Runs every (text, path) synthesis concurrently, at most MAX_CONCURRENT_TTS at once."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TTS)
+
+    async def _generate_one(text, file_path):
+        async with semaphore:
+            await _generate_cached_async(text, file_path)
+            return file_path
+
+    return await asyncio.gather(
+        *(_generate_one(text, file_path) for text, file_path in pairs),
+        return_exceptions=True
+    )
+
+def generate_speech_many(pairs: list[tuple[str, str]]) -> list[str]:
+    """
+    Synthesizes several utterances at once, e.g. a paragraph split into sentences.
+    Takes (text, output_file_path) pairs; N utterances cost roughly the
+    slowest one instead of the sum.
+
+    Returns:
+        For each pair, in order, the saved audio path or an "Error: ..." string.
+    """
+    if not pairs:
+        return []
+
+    if _on_tts_loop():
+        logger.error("Error: generate_speech_many called from the TTS event loop.")
+        return ["Error: Could not run asyncio: called from the TTS event loop"] * len(pairs)
+
+    # Allow one full timeout per "wave" of concurrent requests
+    waves = math.ceil(len(pairs) / MAX_CONCURRENT_TTS)
+    future = asyncio.run_coroutine_threadsafe(_generate_many_async(pairs), _LOOP)
+    try:
+        results = future.result(timeout=TTS_TIMEOUT_SECONDS * waves)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        logger.error("Batch speech generation timed out")
+        return ["Error: Speech generation timed out"] * len(pairs)
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+        return [f"Error: {e}"] * len(pairs)
+
+    return [
+        f"Error: {result}" if isinstance(result, BaseException) else result
+        for result in results
+    ]
+
+async def _generate_bytes_async(text: str) -> bytes:
+    """
+    Returns speech for the text as MP3 bytes, collected in memory.
+    A clip already in the disk cache is read from there instead.
+    """
+    cached = await asyncio.to_thread(_read_cached, _cache_path(text))
+    if cached is not None:
+        logger.debug("--- 🔊 TTS cache hit for: '%.30s...' ---", text)
+        return cached
+
+    logger.debug("--- 🔊 Generating speech bytes for: '%.30s...' ---", text)
+    buffer = bytearray()
+    async for data in _stream_audio(text):
+        buffer.extend(data)
+    return bytes(buffer)
+
+def generate_speech_bytes(text_to_speak: str) -> bytes:
+    """
+    Like generate_speech, but returns the MP3 audio instead of writing a file,
+    for callers that send it straight on (e.g. over HTTP) and would otherwise
+    have to read the file back.
+    
+    Returns:
+        The MP3 audio, or b"" if generation failed.
+    """
+    if _on_tts_loop():
+        logger.error("Error: generate_speech_bytes called from the TTS event loop.")
+        return b""
+
+    future = asyncio.run_coroutine_threadsafe(_generate_bytes_async(text_to_speak), _LOOP)
+    try:
+        return future.result(timeout=TTS_TIMEOUT_SECONDS)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        logger.error("Speech generation timed out after %ss", TTS_TIMEOUT_SECONDS)
+        return b""
     except Exception as e:
-        if "cannot run current event loop" in str(e):
-            print("Error: Asyncio loop already running.")
-            return f"Error: Could not run asyncio: {e}"
-        else:
-            print(f"An error occurred: {e}")
-            return f"Error: {e}"
+        logger.error("An error occurred: %s", e)
+        return b""
 
 # --- This part is for testing ---
 if __name__ == "__main__":
@@ -1,58 +1,403 @@
+import codecs
+import ipaddress
+import logging
+import re
 import requests
-from bs4 import BeautifulSoup
+import socket
+import streamlit as st
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
 from langchain_core.tools import tool
 
-@tool
-def scrape_web_page(url: str) -> str:
+logger = logging.getLogger(__name__)
+
+# Truncate to a reasonable length to not overwhelm the LLM context
+MAX_LENGTH = 8000 # ~8000 characters
+
+# Never read more than this much HTML: bounds parse time and memory on huge
+# pages, while leaving plenty of markup to yield MAX_LENGTH chars of text
+MAX_BYTES = 512_000
+
+# Non-content tags skipped (with their text) while extracting the page text.
+# A frozenset, since the parser checks every start and end tag against it.
+STRIP_TAGS = frozenset({
+    "script", "style", "nav", "footer", "aside", "noscript", "iframe", "svg"
+})
+
+# Per-host throttling: at most this many concurrent requests to one host,
+# and a host that was this slow several times in a row is paused for a while
+MAX_REQUESTS_PER_HOST = 4
+SLOW_REQUEST_SECONDS = 5
+SLOW_STREAK = 3
+BREAKER_COOLDOWN_SECONDS = 60
+# Hosts remembered at once; idle ones beyond this are forgotten
+MAX_TRACKED_HOSTS = 256
+
+# Default request headers, registered once on the session below
+_HEADERS = {
+    # Set a user-agent to pretend to be a browser
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # Ask for HTML, so servers that negotiate don't send JSON or images
+    'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+}
+
+# Shared session: successive scrapes of the same host reuse the TCP/TLS
+# connection. requests already advertises every Content-Encoding it can decode.
+_session = requests.Session()
+_session.headers.update(_HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+# Collapses the whitespace around line breaks, dropping blank lines: the same
+# result as stripping every line and skipping empty ones. The lookbehind only
+# lets a match start at the beginning of a whitespace run, which keeps long
+# runs of spaces linear instead of rescanning them from every position.
+# Line breaks are everything str.splitlines() splits on, not just \r and \n.
+_BREAK_CHARS = r"\n\r\v\f\x1c-\x1e\x85\u2028\u2029"
+_INLINE_SPACE = rf"[^\S{_BREAK_CHARS}]"
+LINE_BREAKS_RE = re.compile(rf"(?<!{_INLINE_SPACE}){_INLINE_SPACE}*[{_BREAK_CHARS}]\s*")
+
+# Finds a <meta charset> / http-equiv declaration near the top of a page
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+def _known_encoding(name: str) -> Optional[str]:
     """
-    Scrapes the text content from a given URL.
-    Use this tool when you need to get the full content, summary, 
-    or specific details from a specific web page link. 
-    Only use this if you have a URL.
+    Returns Python's name for a declared charset, or None if it's unknown
+    (a typo, or a bytes-to-bytes codec such as 'base64').
+    """
+    try:
+        info = codecs.lookup(name)
+    except (LookupError, ValueError):
+        return None
+    # The same check bytes.decode() makes before using a codec
+    if not getattr(info, "_is_text_encoding", True):
+        return None
+    return info.name
+
+def _detect_encoding(response, first_chunk: bytes) -> str:
+    """
+    Picks the page encoding: HTTP header first, then <meta charset>, then UTF-8.
+    (libxml2 assumes Latin-1 when nothing is declared, which garbles UTF-8 pages.)
+    A charset Python doesn't know is skipped rather than failing the scrape.
     """
-    print(f"--- 🛠️ [Tool] Scraping URL: {url} ---")
+    content_type = response.headers.get("Content-Type", "")
+    if "charset=" in content_type:
+        encoding = _known_encoding(content_type.split("charset=")[-1].split(";")[0].strip(" \"'"))
+        if encoding:
+            return encoding
+
+    match = META_CHARSET_RE.search(first_chunk[:2048])
+    if match:
+        encoding = _known_encoding(match.group(1).decode("ascii"))
+        if encoding:
+            return encoding
+
+    return "utf-8"
 
+# Hostnames that only ever point at local or cloud-internal services
+BLOCKED_HOSTS = frozenset({"localhost", "metadata", "metadata.google.internal"})
+
+def _validate_url(url: str) -> Optional[str]:
+    """
+    Rejects URLs that can't or shouldn't be fetched, before any connection
+    attempt (a typo would otherwise burn the full timeout).
+
+    Returns:
+        An error message, or None if the URL is OK to fetch.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").rstrip(".")
+    except ValueError:
+        host = ""
+        parts = None
+
+    if parts is None or parts.scheme not in ("http", "https") or not host:
+        return f"Error: Invalid URL '{url}'. Provide a full http:// or https:// link."
+
+    # Public sites always have a dotted name (or an IPv6 literal);
+    # a bare 'http://foo' is a typo or an intranet host
+    if "." not in host and ":" not in host:
+        return f"Error: Invalid URL '{url}'. The host '{host}' is not a public domain."
+
+    # Don't let the agent reach internal services (SSRF)
+    if host in BLOCKED_HOSTS or host.endswith((".localhost", ".internal")):
+        return "Error: Refusing to scrape an internal address."
+
+    # Check every address the host resolves to, rather than only IP literals
+    # ipaddress can parse: the resolver also accepts shorthand IPv4 such as
+    # '127.1', '0177.0.0.1' or '0x7f.0.0.1', and a name can point anywhere
     try:
-        # Set a user-agent to pretend to be a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError):
+        return f"Error: Could not resolve host '{host}'."
+
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0]) # Drop any IPv6 zone ID
+        ip = getattr(ip, "ipv4_mapped", None) or ip
+        if not ip.is_global:
+            return "Error: Refusing to scrape an internal address."
+
+    return None
+
+# Redirects are followed by hand, so every hop gets the same checks
+MAX_REDIRECTS = 5
+
+class _BlockedRedirect(Exception):
+    """Raised when a page redirects to a URL that _validate_url rejects."""
+
+def _get_page(url: str) -> requests.Response:
+    """
+    GETs a page (streamed), following up to MAX_REDIRECTS redirects.
+    requests would follow them to any address, so a public redirector or
+    URL shortener could bounce the scraper to 127.0.0.1 or a cloud metadata
+    endpoint; here each target is validated before it is fetched.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _session.get(url, timeout=10, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+
+        location = _session.get_redirect_target(response)
+        response.close()
+        url = urljoin(response.url, location)
+        error = _validate_url(url)
+        if error:
+            raise _BlockedRedirect(error)
+
+    raise requests.TooManyRedirects(f"Exceeded {MAX_REDIRECTS} redirects")
+
+class _HostState:
+    """
+    Per-host concurrency limit plus a simple circuit breaker: after
+    SLOW_STREAK requests in a row slower than SLOW_REQUEST_SECONDS, the host
+    is skipped for BREAKER_COOLDOWN_SECONDS instead of burning the timeout again.
+    Use as a context manager to hold one of the host's request slots.
+    """
+
+    def __init__(self):
+        self._semaphore = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        self._lock = threading.Lock()
+        self._active = 0 # Requests holding or waiting for a slot
+        self._slow_streak = 0
+        self._open_until = 0.0
+
+    def __enter__(self):
+        with self._lock:
+            self._active += 1
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+        with self._lock:
+            self._active -= 1
+
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def is_idle(self) -> bool:
+        """True when nothing is using this state, so forgetting it loses nothing."""
+        return not self._active and not self.is_open()
+
+    def record(self, seconds: float):
+        with self._lock:
+            if seconds <= SLOW_REQUEST_SECONDS:
+                self._slow_streak = 0
+                return
+            self._slow_streak += 1
+            if self._slow_streak >= SLOW_STREAK:
+                logger.debug("--- 🛠️ [Tool] Host too slow, pausing it for %ss ---", BREAKER_COOLDOWN_SECONDS)
+                self._open_until = time.monotonic() + BREAKER_COOLDOWN_SECONDS
+                self._slow_streak = 0
+
+# Most recently used last, so idle hosts are forgotten oldest-first
+_host_states = OrderedDict()
+_host_states_lock = threading.Lock()
+
+def _host_state(hostname: str) -> _HostState:
+    """Returns the shared _HostState for a hostname, creating it on first use."""
+    with _host_states_lock:
+        state = _host_states.pop(hostname, None) or _HostState()
+        _host_states[hostname] = state
+
+        # Keep the table bounded, but never drop a host that is mid-request
+        # or paused (that would hand out a fresh limit / reset its breaker)
+        if len(_host_states) > MAX_TRACKED_HOSTS:
+            for name, old_state in list(_host_states.items()):
+                if len(_host_states) <= MAX_TRACKED_HOSTS:
+                    break
+                if old_state.is_idle():
+                    del _host_states[name]
+        return state
+
+class _TextCollector:
+    """
+    lxml parser target that keeps only the page text, skipping everything
+    inside STRIP_TAGS. Lets us extract text while the page is still downloading,
+    and stops keeping text once there's more than MAX_LENGTH of it.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.chars = 0 # Non-whitespace characters collected so far
+        self.full = False # True once the rest of the page would be cut anyway
+        self._skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag in STRIP_TAGS:
+            self._skip_depth += 1
+
+    def end(self, tag):
+        if tag in STRIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title" and not self._skip_depth:
+            # Keep the page title on its own line, ahead of the body text
+            self.data("\n")
+
+    def data(self, data):
+        if self._skip_depth or self.full:
+            return
+        self.parts.append(data)
+        self.chars += sum(map(len, data.split()))
+        # Cleanup only removes whitespace, so the final text is now
+        # guaranteed to exceed MAX_LENGTH
+        if self.chars > MAX_LENGTH:
+            self.full = True
+
+    def close(self):
+        return "".join(self.parts)
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _fetch_text(url: str) -> str:
+    """
+    Downloads a page and extracts its visible text.
+    Cached for 10 minutes per URL, since the agent often scrapes the same
+    link more than once. Errors are raised (and therefore never cached).
+    """
+    host = _host_state(urlsplit(url).hostname)
+    if host.is_open():
+        raise RuntimeError("This site has been responding too slowly; try again in a minute.")
 
-        response = requests.get(url, headers=headers, timeout=10)
+    # Hold a slot for the whole download, not just until the headers arrive
+    with host:
+        # Stream the body so parsing overlaps with the download
+        started = time.monotonic() # Time to response, not time spent waiting for a slot
+        try:
+            response = _get_page(url)
+        finally:
+            host.record(time.monotonic() - started)
 
-        # Check for successful response
-        if response.status_code != 200:
-            return f"Error: Failed to retrieve page (Status code: {response.status_code})"
+        try:
+            # Check for successful response (raised, so failures are never cached)
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Failed to retrieve page (Status code: {response.status_code})")
 
-        # Parse the HTML
-        soup = BeautifulSoup(response.content, 'html.parser')
+            # --- Extract text ---
+            # Feed chunks into lxml's incremental HTML parser as they arrive.
+            # The collector drops <script>, <style> and other non-text tags.
+            collector = _TextCollector()
+            parser = etree.HTMLParser(target=collector)
+            decoder = None
+            bytes_read = 0
+            truncated = False
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if decoder is None:
+                    # The first chunk is enough to find a <meta charset>.
+                    # Decoding here (not in libxml2) means any charset Python
+                    # knows works, and libxml2 never second-guesses it.
+                    encoding = _detect_encoding(response, chunk)
+                    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+                parser.feed(decoder.decode(chunk))
+                bytes_read += len(chunk)
 
-        # --- Extract text ---
-        # This is a basic text extraction. It strips out <script>, <style>,
-        # and other non-text tags.
+                # Stop downloading once we have more text than we'll return,
+                # or once the page is too big to be worth reading further.
+                # lxml copes fine with the truncated HTML.
+                if collector.full or bytes_read >= MAX_BYTES:
+                    truncated = True
+                    break
 
-        # Remove non-content tags
-        for script_or_style in soup(["script", "style", "nav", "footer", "aside"]):
-            script_or_style.decompose()
+            if decoder is not None:
+                parser.feed(decoder.decode(b"", final=True))
+                raw_text = parser.close()
+            else:
+                raw_text = "" # Empty body
+            # close() flushes the parser's buffered text, which can fill the collector too
+            truncated = truncated or collector.full
 
-        # Get the text, strip whitespace, and join lines
-        text_lines = (line.strip() for line in soup.get_text().splitlines())
-        # Re-join lines into a single coherent block of text
-        text_content = '\n'.join(line for line in text_lines if line)
+        finally:
+            response.close()
 
-        # Truncate to a reasonable length to not overwhelm the LLM context
-        max_length = 8000 # ~8000 characters
+    # Strip whitespace around line breaks and drop blank lines
+    text_content = LINE_BREAKS_RE.sub("\n", raw_text).strip()
 
-        if len(text_content) > max_length:
-            print(f"--- 🛠️ [Tool] Content truncated (was {len(text_content)} chars) ---")
-            return text_content[:max_length] + "... (content truncated)"
-        else:
-            print(f"--- 🛠️ [Tool] Scrape successful ({len(text_content)} chars) ---")
-            return text_content
+    # Only a truncated page can be over MAX_LENGTH, and the collector
+    # already bounded how much text there is to slice
+    if truncated:
+        logger.debug("--- 🛠️ [Tool] Content truncated (kept %d chars) ---", min(len(text_content), MAX_LENGTH))
+        return text_content[:MAX_LENGTH] + "... (content truncated)"
+    else:
+        logger.debug("--- 🛠️ [Tool] Scrape successful (%d chars) ---", len(text_content))
+        return text_content
 
+def _scrape(url: str) -> str:
+    """
+    Fetches a page and returns its visible text (or an error message).
+    Shared by the scrape_web_page tool and scrape_many.
+    """
+    logger.debug("--- 🛠️ [Tool] Scraping URL: %s ---", url)
+
+    error = _validate_url(url)
+    if error:
+        return error
+
+    try:
+        return _fetch_text(url)
+    except _BlockedRedirect as e:
+        return str(e)
+    except requests.HTTPError as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error during scraping: {e}"
 
+@tool
+def scrape_web_page(url: str) -> str:
+    """
+    Scrapes the text content from a given URL.
+    Use this tool when you need to get the full content, summary, 
+    or specific details from a specific web page link. 
+    Only use this if you have a URL.
+    """
+    return _scrape(url)
+
+def scrape_many(urls: list[str], max_workers: int = 8) -> list[str]:
+    """
+    Scrapes several URLs concurrently.
+    Scraping is network-bound, so threads overlap the waits and N pages
+    cost roughly the slowest one instead of the sum.
+
+    Returns:
+        The text (or error message) for each URL, in the same order.
+    """
+    if not urls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(_scrape, urls))
+
 # --- This part is for testing ---
 if __name__ == "__main__":
     print("Testing Web Scraper Module...")
@@ -61,4 +406,16 @@ if __name__ == "__main__":
     test_url_1 = "https://lilianweng.github.io/posts/2023-06-23-agent/"
     print(f"\n--- Scraping: {test_url_1} ---")
     content1 = scrape_web_page.invoke(test_url_1)
-    print(content1[:500] + "...") # Print first 500 chars
\ No newline at end of file
+    print(content1[:500] + "...") # Print first 500 chars
+
+    # Test 2: Internal addresses must be refused, including shorthand IPv4
+    # forms the resolver expands (127.1 -> 127.0.0.1, 10.1 -> 10.0.0.1)
+    print("\n--- Checking SSRF protection ---")
+    for internal_url in [
+        "http://127.0.0.1/", "http://127.1/", "http://0177.0.0.1/",
+        "http://0x7f.0.0.1/", "http://2130706433/", "http://10.1/",
+        "http://[::1]/", "http://[::ffff:127.0.0.1]/", "http://169.254.169.254/",
+    ]:
+        error = _validate_url(internal_url)
+        print(f"{internal_url}: {'blocked' if error else 'NOT BLOCKED'}")
+        assert error, f"{internal_url} should be refused"